@@ -1,47 +1,166 @@
 # ===== IMPORTS & DEPENDENCIES =====
 import logging
 import asyncio
+import contextlib
 import aiohttp
 import os
 import hashlib
+import gzip
 import time
 import json
 import random
-from typing import Optional, Any, Dict
+import zlib
+import tempfile
+from collections import OrderedDict
+from enum import Enum
+from typing import Optional, Any, Dict, Tuple, Union
 
-from src.config import COMMON_HEADERS
+try:
+    import xxhash
+except ImportError:  # Fall back to hashlib so the client still works without the C extension
+    xxhash = None
+
+try:
+    from orjson import loads as json_loads, JSONDecodeError
+except ImportError:  # Fall back to the stdlib parser; both accept bytes and raise a ValueError subclass
+    from json import loads as json_loads, JSONDecodeError
 
 # ===== CONFIGURATION & CONSTANTS =====
 logger = logging.getLogger(__name__)
+CACHE_COMPRESSION_LEVEL = 1  # Fastest gzip level; still shrinks JSON/HTML responses several times over
+
+_created_dirs = set()  # Cache directories already created by this process
+
+def _ensure_dir(path: str) -> None:
+    """Creates `path` once per process; later calls for the same directory skip the filesystem."""
+    if path not in _created_dirs:
+        os.makedirs(path, exist_ok=True)
+        _created_dirs.add(path)
+
+class CacheState(Enum):
+    """Freshness of a cache file on disk."""
+    FRESH = "fresh"
+    STALE = "stale"  # Expired, but recent enough to serve while a refresh runs in the background
+    MISSING = "missing"
 
 # ===== CORE BUSINESS LOGIC =====
 class BaseWebClient:
     """A base class for web clients providing caching and robust fetching."""
 
+    MEMORY_CACHE_SIZE = 512  # Max entries kept in the in-process LRU in front of the disk cache
+    STALE_TTL_MULTIPLIER = 2  # Cache files younger than this many TTLs are served stale instead of blocking on the network
+    MAX_CONCURRENT_REFRESHES = 8
+
     def __init__(self, cache_dir: str, cache_ttl: int, session: aiohttp.ClientSession):
         self._session = session
         self._cache_dir = cache_dir
         self._cache_ttl = cache_ttl
-        os.makedirs(self._cache_dir, exist_ok=True)
+        # Tasks for fetches currently in progress, keyed by cache path, so identical requests share one download.
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # In-process LRU of parsed content, keyed by cache path: value is (content, expiry timestamp).
+        self._memory_cache: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        # Background stale-while-revalidate refreshes, keyed by cache path.
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self._refresh_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REFRESHES)
+        _ensure_dir(self._cache_dir)
         logger.debug(f"[{self.__class__.__name__}] Initialized with cache dir: {self._cache_dir} and TTL: {self._cache_ttl}s")
 
+    async def close(self) -> None:
+        """Waits for in-flight fetches and background cache refreshes, so none outlive the shared session."""
+        # In-flight fetches keep running after their callers are cancelled, so they are awaited here too.
+        # Loop because a finishing fetch may still schedule a refresh of a stale entry.
+        while pending := [*self._inflight.values(), *self._refresh_tasks.values()]:
+            logger.debug(f"[{self.__class__.__name__}] Waiting for {len(pending)} in-flight fetches and refreshes.")
+            await asyncio.gather(*pending, return_exceptions=True)
+
     def _get_cache_path(self, key: str, extension: str = "json") -> str:
         """Generates a cache file path from a given key."""
-        hashed_key = hashlib.sha256(key.encode('utf-8')).hexdigest()
-        return os.path.join(self._cache_dir, f"{hashed_key}.{extension}")
+        # The hash only names a file, so a fast non-cryptographic hash is enough.
+        if xxhash is not None:
+            hashed_key = xxhash.xxh3_64_hexdigest(key.encode('utf-8'))
+        else:
+            hashed_key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self._cache_dir, f"{hashed_key}.{extension}.gz")
 
-    def _is_cache_valid(self, cache_path: str) -> bool:
-        """Checks if a cache file exists and has not expired."""
-        if not os.path.exists(cache_path):
-            return False
+    def _cache_state(self, cache_path: str) -> Tuple[CacheState, float]:
+        """
+        Classifies a cache file as fresh, stale (servable while refreshing) or missing.
+        Returns the state with the file's mtime, both taken from a single stat call.
+        """
+        try:
+            mtime = os.stat(cache_path).st_mtime
+        except FileNotFoundError:
+            return CacheState.MISSING, 0.0
         
-        file_mod_time = os.path.getmtime(cache_path)
-        if (time.time() - file_mod_time) > self._cache_ttl:
-            logger.debug(f"[{self.__class__.__name__}] Cache file expired: {cache_path}")
-            return False
+        age = time.time() - mtime
+        if age <= self._cache_ttl:
+            logger.debug(f"[{self.__class__.__name__}] Cache file is valid: {cache_path}")
+            return CacheState.FRESH, mtime
+        if age <= self._cache_ttl * self.STALE_TTL_MULTIPLIER:
+            logger.debug(f"[{self.__class__.__name__}] Cache file is stale: {cache_path}")
+            return CacheState.STALE, mtime
         
-        logger.debug(f"[{self.__class__.__name__}] Cache file is valid: {cache_path}")
-        return True
+        logger.debug(f"[{self.__class__.__name__}] Cache file expired: {cache_path}")
+        return CacheState.MISSING, mtime
+
+    def _is_cache_valid(self, cache_path: str) -> bool:
+        """Checks if a cache file exists and has not expired."""
+        return self._cache_state(cache_path)[0] is CacheState.FRESH
+
+    def _get_from_memory(self, cache_path: str) -> Optional[Any]:
+        """Returns unexpired content from the in-process LRU, refreshing its recency."""
+        entry = self._memory_cache.get(cache_path)
+        if entry is None:
+            return None
+        content, expires_at = entry
+        if time.time() > expires_at:
+            del self._memory_cache[cache_path]
+            return None
+        self._memory_cache.move_to_end(cache_path)
+        return content
+
+    def _store_in_memory(self, cache_path: str, content: Any, expires_at: float) -> None:
+        """Adds content to the in-process LRU, evicting the least recently used entry when full."""
+        self._memory_cache[cache_path] = (content, expires_at)
+        self._memory_cache.move_to_end(cache_path)
+        if len(self._memory_cache) > self.MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+
+    def invalidate(self, url: str, is_json: bool = True) -> None:
+        """Drops the cached content of a GET request from memory and disk."""
+        cache_path = self._get_cache_path(url, extension="json" if is_json else "html")
+        self._memory_cache.pop(cache_path, None)
+        try:
+            os.remove(cache_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read_file(path: str, binary: bool = False) -> Union[str, bytes]:
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        return data if binary else data.decode('utf-8')
+
+    @staticmethod
+    def _write_file(path: str, content: Union[str, bytes]) -> None:
+        data = content if isinstance(content, bytes) else content.encode('utf-8')
+        # Write to a temp file and swap it in, so concurrent readers never see a half-written gzip
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False)
+        try:
+            with tmp, gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=CACHE_COMPRESSION_LEVEL) as f:
+                f.write(data)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.remove(tmp.name)
+            raise
+
+    async def _read_cache(self, cache_path: str, binary: bool = False) -> Union[str, bytes]:
+        """Reads a cache file in a worker thread so the event loop is not blocked."""
+        return await asyncio.to_thread(self._read_file, cache_path, binary)
+
+    async def _write_cache(self, cache_path: str, content: Union[str, bytes]) -> None:
+        """Writes a cache file in a worker thread so the event loop is not blocked."""
+        await asyncio.to_thread(self._write_file, cache_path, content)
 
     async def _fetch(
         self,
@@ -61,37 +180,123 @@ class BaseWebClient:
         cache_ext = "json" if is_json else "html"
         cache_path = self._get_cache_path(cache_key, extension=cache_ext)
 
-        if self._is_cache_valid(cache_path):
+        content = self._get_from_memory(cache_path)
+        if content is not None:
+            logger.debug(f"[{self.__class__.__name__}] Loaded content from memory cache: {url}")
+            return content
+
+        task = self._inflight.get(cache_path)
+        if task is not None:
+            logger.debug(f"[{self.__class__.__name__}] Joining in-flight request for: {url}")
+        else:
+            # The fetch runs in its own task, so cancelling any one caller (even the first) leaves it running for the others.
+            task = asyncio.create_task(
+                self._fetch_with_cache(url, cache_path, method, is_json, max_retries, initial_delay, headers, payload)
+            )
+            self._inflight[cache_path] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_path, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_with_cache(
+        self,
+        url: str,
+        cache_path: str,
+        method: str,
+        is_json: bool,
+        max_retries: int,
+        initial_delay: float,
+        headers: Optional[Dict[str, str]],
+        payload: Optional[Dict[str, Any]]
+    ) -> Optional[Any]:
+        """Serves a request from the cache file or the network; called once per in-flight cache path."""
+        state, mtime = await asyncio.to_thread(self._cache_state, cache_path)
+        if state is not CacheState.MISSING:
             logger.info(f"✅ [{self.__class__.__name__}] Loading content from cache: {cache_path}")
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if is_json:
-                    try:
-                        return json.loads(content)
-                    except json.JSONDecodeError:
-                        logger.warning(f"⚠️ [{self.__class__.__name__}] Invalid JSON in cache file {cache_path}. Deleting and re-fetching.")
-                        os.remove(cache_path)
+            content = await self._load_cache_file(cache_path, is_json)
+            if content is not None:
+                if state is CacheState.FRESH:
+                    self._store_in_memory(cache_path, content, mtime + self._cache_ttl)
                 else:
-                    return content
+                    # Keep serving the stale copy from memory, so the file is not re-read while the refresh rewrites it
+                    self._store_in_memory(cache_path, content, mtime + self._cache_ttl * self.STALE_TTL_MULTIPLIER)
+                    self._schedule_refresh(url, cache_path, method, is_json, headers, payload)
+                return content
+
+        return await self._fetch_from_network(url, cache_path, method, is_json, max_retries, initial_delay, headers, payload)
+
+    async def _load_cache_file(self, cache_path: str, is_json: bool) -> Optional[Any]:
+        """Reads and parses a cache file, deleting it if it is truncated or its JSON is corrupt."""
+        try:
+            content = await self._read_cache(cache_path, binary=is_json)
+            return json_loads(content) if is_json else content
+        except (OSError, EOFError, zlib.error, UnicodeDecodeError, JSONDecodeError):
+            logger.warning(f"⚠️ [{self.__class__.__name__}] Corrupt cache file {cache_path}. Deleting and re-fetching.")
+            # Another reader may have deleted it already
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(cache_path)
+            return None
 
+    def _schedule_refresh(
+        self,
+        url: str,
+        cache_path: str,
+        method: str,
+        is_json: bool,
+        headers: Optional[Dict[str, str]],
+        payload: Optional[Dict[str, Any]]
+    ) -> None:
+        """Starts a background re-fetch of a stale cache entry, unless one is already running."""
+        if cache_path in self._refresh_tasks:
+            return
+        logger.debug(f"[{self.__class__.__name__}] Serving stale cache and refreshing in background: {url}")
+        task = asyncio.create_task(self._refresh(url, cache_path, method, is_json, headers, payload))
+        self._refresh_tasks[cache_path] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(cache_path, None))
+
+    async def _refresh(
+        self,
+        url: str,
+        cache_path: str,
+        method: str,
+        is_json: bool,
+        headers: Optional[Dict[str, str]],
+        payload: Optional[Dict[str, Any]]
+    ) -> None:
+        """Re-fetches a stale entry in a single attempt; on failure the stale copy simply keeps being served."""
+        async with self._refresh_semaphore:
+            await self._fetch_from_network(url, cache_path, method, is_json, 1, 0.0, headers, payload)
+
+    async def _fetch_from_network(
+        self,
+        url: str,
+        cache_path: str,
+        method: str,
+        is_json: bool,
+        max_retries: int,
+        initial_delay: float,
+        headers: Optional[Dict[str, str]],
+        payload: Optional[Dict[str, Any]]
+    ) -> Optional[Any]:
+        """Fetches a URL with retries and exponential backoff, then writes it to the disk and memory caches."""
         logger.info(f"➡️ [{self.__class__.__name__}] Fetching from network: {url}")
-        request_headers = headers or COMMON_HEADERS
 
         for attempt in range(max_retries):
             try:
-                async with self._session.request(method, url, headers=request_headers, json=payload, timeout=25) as response:
+                # Default headers and timeout come from the shared session; only per-request overrides are passed.
+                async with self._session.request(method, url, headers=headers, json=payload) as response:
                     response.raise_for_status()
                     
+                    # Cache the raw body as received; JSON is parsed once here and
+                    # once per cache hit, never re-serialized.
                     if is_json:
-                        # content_type=None handles non-standard API content-types
-                        content = await response.json(content_type=None)
-                        file_content = json.dumps(content, ensure_ascii=False, indent=4)
+                        file_content = await response.read()
+                        content = json_loads(file_content)
                     else:
-                        content = await response.text()
-                        file_content = content
+                        file_content = await response.text()
+                        content = file_content
 
-                    with open(cache_path, 'w', encoding='utf-8') as f:
-                        f.write(file_content)
+                    await self._write_cache(cache_path, file_content)
+                    self._store_in_memory(cache_path, content, time.time() + self._cache_ttl)
                     logger.info(f"💾 [{self.__class__.__name__}] Content saved to cache: {cache_path}")
                     return content
                     
@@ -109,7 +314,9 @@ class BaseWebClient:
                 logger.error(f"❌ [{self.__class__.__name__}] Unexpected error fetching {url}: {e}", exc_info=True)
                 return None
 
-            delay = initial_delay * (2 ** attempt) + random.uniform(0, 1)
+            if attempt == max_retries - 1:
+                break  # No point sleeping after the final attempt
+            delay = initial_delay * (1 << attempt) + random.random()
             logger.info(f"Retrying request to {url} in {delay:.2f} seconds...")
             await asyncio.sleep(delay)
         
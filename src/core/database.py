@@ -1,134 +1,254 @@
 # ===== IMPORTS & DEPENDENCIES =====
 import sqlite3
 import logging
-from datetime import datetime, timedelta
-from typing import List, Tuple, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple, Optional
 
 from src.config import DATABASE_PATH
 
 # ===== CONFIGURATION & CONSTANTS =====
 logger = logging.getLogger(__name__)
+# Bump whenever _create_tables or _migrate_schema changes, otherwise existing databases skip the DDL.
+SCHEMA_VERSION = 3  # 1: posted_games.posted_date stored as INTEGER unix seconds
+                    # 2: posted_games keyed by deduplication_key as a WITHOUT ROWID table
+                    # 3: user_subscriptions as a WITHOUT ROWID table, NO_THREAD_ID instead of NULL
+# Stored in place of a NULL thread_id (non-topic chats) so it can be part of the primary key.
+# Telegram never assigns 0 as a message_thread_id.
+NO_THREAD_ID = 0
 
 # ===== CORE BUSINESS LOGIC =====
 class Database:
     """Handles all database operations for the bot, including subscriptions and posted games."""
+
+    # Hot-path SQL kept as constants so every call hits sqlite3's prepared statement cache.
+    _SQL_IS_POSTED = "SELECT 1 FROM posted_games WHERE deduplication_key = ? AND posted_date >= ?"
+    _SQL_INSERT_POSTED = "INSERT OR IGNORE INTO posted_games (deduplication_key, posted_date) VALUES (?, ?)"
+    _SQL_INSERT_POSTED_RETURNING = _SQL_INSERT_POSTED + " RETURNING 1"
+    _SQL_GET_TARGETS = "SELECT store_name, chat_id, thread_id FROM user_subscriptions"
+    _SQL_GET_USER_SUBS = "SELECT store_name FROM user_subscriptions WHERE chat_id = ? AND thread_id = ?"
+    _SQL_ADD_SUB = "INSERT OR IGNORE INTO user_subscriptions (chat_id, thread_id, store_name) VALUES (?, ?, ?)"
+    _SQL_DEL_SUB = "DELETE FROM user_subscriptions WHERE chat_id = ? AND thread_id = ? AND store_name = ?"
+    USER_SUBS_CACHE_SIZE = 1024  # Chats whose subscription lists are kept in memory
+    # Keys per IN (...) probe in filter_unposted; stays below SQLITE_MAX_VARIABLE_NUMBER on old builds (999)
+    PROBE_CHUNK_SIZE = 500
     
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
-        self._create_tables()
+        # A single long-lived connection avoids re-opening the file and re-parsing the schema on every call.
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        self._lock = threading.Lock()
+        # store_name -> [(chat_id, thread_id)], built lazily and dropped whenever subscriptions change.
+        self._sub_index: Optional[Dict[str, List[Tuple[int, Optional[int]]]]] = None
+        # (chat_id, thread key) -> subscribed stores, an LRU filled on demand and updated on every change.
+        self._user_subs_cache: "OrderedDict[Tuple[int, int], List[str]]" = OrderedDict()
+        self._configure_connection()
+        # The schema DDL only needs to run for new or outdated database files.
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._create_tables()
+            self._migrate_schema()
         logger.info(f"[{self.__class__.__name__}] Database initialized at: {self.db_path}")
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Returns a new database connection."""
-        return sqlite3.connect(self.db_path)
+    def _configure_connection(self) -> None:
+        """Applies performance-oriented PRAGMAs to the shared connection."""
+        self._conn.executescript("""
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-20000;
+            PRAGMA mmap_size=268435456;
+        """)
+        # In-memory databases cannot use WAL, so only switch file-backed ones
+        if self.db_path != ':memory:' and not self.db_path.startswith('file::memory:'):
+            journal_mode = self._conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if journal_mode.lower() != 'wal':
+                logger.warning(f"[{self.__class__.__name__}] Could not enable WAL mode; journal_mode is '{journal_mode}'.")
+
+    def close(self) -> None:
+        """Closes the shared database connection."""
+        self._conn.close()
 
     def _create_tables(self) -> None:
         """Creates required tables if they don't exist."""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # Table for tracking posted games
+        with self._lock:
+            cursor = self._conn.cursor()
+            # Table for tracking posted games. WITHOUT ROWID stores posted_date inside the key's
+            # B-tree, so the "posted recently?" probe is answered by a single index search.
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS posted_games (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    deduplication_key TEXT UNIQUE NOT NULL,
-                    posted_date TEXT NOT NULL
-                )
+                    deduplication_key TEXT PRIMARY KEY NOT NULL,
+                    posted_date INTEGER NOT NULL
+                ) WITHOUT ROWID
             """)
-            # Table for tracking user subscriptions. Thread_id can be NULL for non-topic chats.
+            # Table for tracking user subscriptions. Non-topic chats use NO_THREAD_ID as thread_id.
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS user_subscriptions (
                     chat_id INTEGER NOT NULL,
-                    thread_id INTEGER,
+                    thread_id INTEGER NOT NULL,
                     store_name TEXT NOT NULL,
-                    UNIQUE(chat_id, store_name, thread_id)
-                )
+                    PRIMARY KEY (chat_id, thread_id, store_name)
+                ) WITHOUT ROWID
             """)
-            conn.commit()
             logger.info(f"[{self.__class__.__name__}] Database tables verified/created.")
 
+    def _migrate_schema(self) -> None:
+        """Upgrades tables created by older versions of the bot, tracked via PRAGMA user_version."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+            columns = {row[1]: row[2] for row in self._conn.execute("PRAGMA table_info(posted_games)")}
+            # PRAGMA table_info column 5 is the column's position in the primary key (0 if not part of it)
+            subs_pk = {row[1]: row[5] for row in self._conn.execute("PRAGMA table_info(user_subscriptions)")}
+            self._conn.execute("BEGIN")
+            try:
+                if 'id' in columns:
+                    # Rebuild rowid tables from older versions, converting ISO-8601 dates to unix seconds
+                    if columns.get('posted_date', '').upper() == 'TEXT':
+                        posted_date_expr = "CAST(strftime('%s', posted_date) AS INTEGER)"
+                    else:
+                        posted_date_expr = "posted_date"
+                    self._conn.execute("""
+                        CREATE TABLE posted_games_new (
+                            deduplication_key TEXT PRIMARY KEY NOT NULL,
+                            posted_date INTEGER NOT NULL
+                        ) WITHOUT ROWID
+                    """)
+                    self._conn.execute(f"""
+                        INSERT OR IGNORE INTO posted_games_new (deduplication_key, posted_date)
+                        SELECT deduplication_key, {posted_date_expr} FROM posted_games
+                    """)
+                    self._conn.execute("DROP TABLE posted_games")
+                    self._conn.execute("ALTER TABLE posted_games_new RENAME TO posted_games")
+                    logger.info(f"[{self.__class__.__name__}] Migrated posted_games to a WITHOUT ROWID table with unix timestamps.")
+                if not subs_pk.get('thread_id'):
+                    # Rebuild the rowid + UNIQUE table from older versions, mapping NULL thread ids to NO_THREAD_ID
+                    self._conn.execute("""
+                        CREATE TABLE user_subscriptions_new (
+                            chat_id INTEGER NOT NULL,
+                            thread_id INTEGER NOT NULL,
+                            store_name TEXT NOT NULL,
+                            PRIMARY KEY (chat_id, thread_id, store_name)
+                        ) WITHOUT ROWID
+                    """)
+                    self._conn.execute("""
+                        INSERT OR IGNORE INTO user_subscriptions_new (chat_id, thread_id, store_name)
+                        SELECT chat_id, COALESCE(thread_id, ?), store_name FROM user_subscriptions
+                    """, (NO_THREAD_ID,))
+                    self._conn.execute("DROP TABLE user_subscriptions")
+                    self._conn.execute("ALTER TABLE user_subscriptions_new RENAME TO user_subscriptions")
+                    logger.info(f"[{self.__class__.__name__}] Migrated user_subscriptions to a WITHOUT ROWID table.")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
     def add_posted_game(self, deduplication_key: str) -> None:
         """Adds a game's deduplication key to the posted_games table."""
-        posted_date = datetime.now().isoformat()
-        with self._get_connection() as conn:
+        posted_date = int(time.time())
+        with self._lock:
             try:
-                conn.execute(
-                    "INSERT INTO posted_games (deduplication_key, posted_date) VALUES (?, ?)",
-                    (deduplication_key, posted_date)
-                )
-                conn.commit()
-                logger.info(f"[{self.__class__.__name__}] Added posted game to DB with key: {deduplication_key}")
-            except sqlite3.IntegrityError:
-                logger.warning(f"[{self.__class__.__name__}] Game with key '{deduplication_key}' already exists in DB.")
+                # OR IGNORE + RETURNING reports duplicates as "no row" instead of raising IntegrityError
+                row = self._conn.execute(self._SQL_INSERT_POSTED_RETURNING, (deduplication_key, posted_date)).fetchone()
+                if row is not None:
+                    logger.info("[%s] Added posted game to DB with key: %s", self.__class__.__name__, deduplication_key)
+                else:
+                    logger.debug("[%s] Game with key '%s' already exists in DB.", self.__class__.__name__, deduplication_key)
             except Exception as e:
                 logger.error(f"[{self.__class__.__name__}] Error adding game to DB: {e}", exc_info=True)
 
+    def add_posted_games(self, deduplication_keys: Iterable[str]) -> None:
+        """Adds several deduplication keys in a single transaction."""
+        posted_date = int(time.time())
+        rows = [(key, posted_date) for key in deduplication_keys]
+        if not rows:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(self._SQL_INSERT_POSTED, rows)
+                self._conn.execute("COMMIT")
+                logger.info("[%s] Added %s posted games to DB in one batch.", self.__class__.__name__, len(rows))
+            except Exception as e:
+                # BEGIN IMMEDIATE itself may fail (e.g. database locked), leaving nothing to roll back
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error(f"[{self.__class__.__name__}] Error adding games to DB: {e}", exc_info=True)
+
     def is_game_posted_in_last_days(self, deduplication_key: str, days: int = 30) -> bool:
         """Checks if a game with the given key has been posted in the last `days`."""
-        threshold_date = (datetime.now() - timedelta(days=days)).isoformat()
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT 1 FROM posted_games WHERE deduplication_key = ? AND posted_date >= ?",
-                (deduplication_key, threshold_date)
-            )
-            return cursor.fetchone() is not None
+        return self.is_game_posted_since(deduplication_key, int(time.time()) - days * 86400)
+
+    def is_game_posted_since(self, deduplication_key: str, cutoff: int) -> bool:
+        """Checks if a game with the given key has been posted at or after the unix timestamp `cutoff`."""
+        with self._lock:
+            return self._conn.execute(self._SQL_IS_POSTED, (deduplication_key, cutoff)).fetchone() is not None
+
+    def filter_unposted(self, deduplication_keys: Iterable[str], cutoff: int) -> Set[str]:
+        """Returns the keys that have not been posted at or after the unix timestamp `cutoff`."""
+        keys = list(dict.fromkeys(deduplication_keys))
+        posted = set()
+        with self._lock:
+            # One IN (...) probe per chunk instead of one query per key, kept under SQLite's parameter limit
+            for start in range(0, len(keys), self.PROBE_CHUNK_SIZE):
+                chunk = keys[start:start + self.PROBE_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT deduplication_key FROM posted_games WHERE deduplication_key IN ({placeholders}) AND posted_date >= ?",
+                    (*chunk, cutoff)
+                )
+                posted.update(row[0] for row in rows)
+        return set(keys) - posted
+
+    @staticmethod
+    def _thread_key(thread_id: Optional[int]) -> int:
+        """Maps an optional thread id to the non-NULL value stored in user_subscriptions."""
+        return NO_THREAD_ID if thread_id is None else thread_id
 
     def add_subscription(self, chat_id: int, store_name: str, thread_id: Optional[int] = None) -> None:
-        """Adds a new subscription for a user."""
-        with self._get_connection() as conn:
+        """Adds a new subscription for a user. `store_name` must already be canonical (lowercase)."""
+        with self._lock:
             try:
-                conn.execute(
-                    "INSERT OR IGNORE INTO user_subscriptions (chat_id, thread_id, store_name) VALUES (?, ?, ?)",
-                    (chat_id, thread_id, store_name.lower())
-                )
-                conn.commit()
-                logger.info(f"[{self.__class__.__name__}] Subscription processed for chat={chat_id}, thread={thread_id}, store='{store_name}'")
+                self._conn.execute(self._SQL_ADD_SUB, (chat_id, self._thread_key(thread_id), store_name))
+                self._sub_index = None
+                self._user_subs_cache.pop((chat_id, self._thread_key(thread_id)), None)
+                logger.info("[%s] Subscription processed for chat=%s, thread=%s, store='%s'", self.__class__.__name__, chat_id, thread_id, store_name)
             except Exception as e:
                 logger.error(f"[{self.__class__.__name__}] Error adding subscription: {e}", exc_info=True)
 
     def remove_subscription(self, chat_id: int, store_name: str, thread_id: Optional[int] = None) -> None:
-        """Removes an existing subscription."""
-        query = "DELETE FROM user_subscriptions WHERE chat_id = ? AND store_name = ? AND "
-        params = [chat_id, store_name.lower()]
-        
-        if thread_id is None:
-            query += "thread_id IS NULL"
-        else:
-            query += "thread_id = ?"
-            params.append(thread_id)
-
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(params))
-            conn.commit()
+        """Removes an existing subscription. `store_name` must already be canonical (lowercase)."""
+        with self._lock:
+            cursor = self._conn.execute(self._SQL_DEL_SUB, (chat_id, self._thread_key(thread_id), store_name))
+            self._sub_index = None
+            self._user_subs_cache.pop((chat_id, self._thread_key(thread_id)), None)
             if cursor.rowcount > 0:
-                logger.info(f"[{self.__class__.__name__}] Removed subscription for chat={chat_id}, thread={thread_id}, store='{store_name}'")
+                logger.info("[%s] Removed subscription for chat=%s, thread=%s, store='%s'", self.__class__.__name__, chat_id, thread_id, store_name)
             else:
-                logger.warning(f"[{self.__class__.__name__}] No subscription found to remove for chat={chat_id}, thread={thread_id}, store='{store_name}'")
+                logger.warning("[%s] No subscription found to remove for chat=%s, thread=%s, store='%s'", self.__class__.__name__, chat_id, thread_id, store_name)
 
     def get_user_subscriptions(self, chat_id: int, thread_id: Optional[int] = None) -> List[str]:
         """Returns the list of stores a user is subscribed to."""
-        query = "SELECT store_name FROM user_subscriptions WHERE chat_id = ? AND "
-        params = [chat_id]
-        
-        if thread_id is None:
-            query += "thread_id IS NULL"
-        else:
-            query += "thread_id = ?"
-            params.append(thread_id)
-
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(params))
-            return [row[0] for row in cursor.fetchall()]
+        key = (chat_id, self._thread_key(thread_id))
+        with self._lock:
+            stores = self._user_subs_cache.get(key)
+            if stores is None:
+                stores = [row[0] for row in self._conn.execute(self._SQL_GET_USER_SUBS, key)]
+                self._user_subs_cache[key] = stores
+                if len(self._user_subs_cache) > self.USER_SUBS_CACHE_SIZE:
+                    self._user_subs_cache.popitem(last=False)
+            else:
+                self._user_subs_cache.move_to_end(key)
+            return list(stores)
 
     def get_targets_for_store(self, store_name: str) -> List[Tuple[int, Optional[int]]]:
         """Returns a list of (chat_id, thread_id) for subscribers of a given store."""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # Select users subscribed to the specific store OR to 'all' stores
-            cursor.execute(
-                "SELECT DISTINCT chat_id, thread_id FROM user_subscriptions WHERE store_name = ? OR store_name = 'all'",
-                (store_name.lower(),)
-            )
-            return cursor.fetchall()
\ No newline at end of file
+        with self._lock:
+            if self._sub_index is None:
+                self._sub_index = {}
+                for store, chat_id, thread_id in self._conn.execute(self._SQL_GET_TARGETS):
+                    self._sub_index.setdefault(store, []).append((chat_id, None if thread_id == NO_THREAD_ID else thread_id))
+            # Subscribers of the specific store plus those subscribed to 'all' stores, without duplicates
+            targets = self._sub_index.get(store_name.lower(), []) + self._sub_index.get('all', [])
+            return list(dict.fromkeys(targets))
\ No newline at end of file
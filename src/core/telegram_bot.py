@@ -1,26 +1,109 @@
 # ===== IMPORTS & DEPENDENCIES =====
+import asyncio
 import logging
+from datetime import timedelta
+from html import escape
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
-from telegram.error import TelegramError
-from typing import Optional, Tuple
+from telegram.constants import ParseMode
+from telegram.ext import AIORateLimiter, Application, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.request import HTTPXRequest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from typing import Dict, List, Optional, Tuple
 
 from src.core.database import Database
 from src.models.game import GameData
 from src.config import TELEGRAM_STORE_DISPLAY_NAMES
 
+try:
+    import aiolimiter  # Backs AIORateLimiter (python-telegram-bot[rate-limiter])
+except ImportError:
+    aiolimiter = None
+
+try:
+    import h2  # Enables HTTP/2 in httpx (python-telegram-bot[http2])
+except ImportError:
+    h2 = None
+
 # ===== CONFIGURATION & CONSTANTS =====
 logger = logging.getLogger(__name__)
+# Canonical (lowercase) store names accepted from subscription buttons
+VALID_STORES = frozenset(TELEGRAM_STORE_DISPLAY_NAMES)
+# Upper bound on in-flight sends, below Telegram's global limit of ~30 messages per second
+MAX_CONCURRENT_SENDS = 25
+# Outgoing request budget: stay under Telegram's ~30 msg/s global and 20 msg/min per-group limits
+RATE_LIMIT_OVERALL_PER_SECOND = 25
+RATE_LIMIT_GROUP_PER_MINUTE = 20
+# HTTP/2 multiplexes concurrent API calls over one connection; fall back to HTTP/1.1 without h2
+HTTP_VERSION = "2" if h2 is not None else "1.1"
+# Updates the Application may process at the same time instead of one after another
+MAX_CONCURRENT_UPDATES = 16
+# Seconds each getUpdates long-poll waits server-side for new updates before returning empty
+POLLING_TIMEOUT = 30
+# Attempts per notification when Telegram asks us to back off or the network fails (TimedOut is a NetworkError)
+MAX_SEND_ATTEMPTS = 3
+# Longest description included in a notification before it is cut with "..."
+MAX_DESCRIPTION_LENGTH = 300
+# Static notification markup (HTML parse mode)
+FREE_GAME_HEADER = "🎮 <b>بازی رایگان جدید!</b> 🎮"
+DISCOUNT_HEADER = "💰 <b>تخفیف ویژه!</b> 💰"
+DLC_LINE = "نوع: <b>DLC / محتوای اضافی</b>"
+WELCOME_TEMPLATE = (
+    "سلام {full_name}! 👋\n\n"
+    "به ربات 'بازی‌های رایگان' خوش آمدید. من هر روز جدیدترین بازی‌های رایگان و تخفیف‌های ویژه را از فروشگاه‌های مختلف پیدا کرده و به شما اطلاع می‌دهم.\n\n"
+    "دستورات موجود:\n"
+    "/subscribe - برای اشتراک در فروشگاه‌های مورد علاقه.\n"
+    "/unsubscribe - برای لغو اشتراک.\n"
+    "/mysubscriptions - برای مشاهده اشتراک‌های فعلی."
+)
 
 # ===== CORE BUSINESS LOGIC =====
 class TelegramBot:
     """Handles all Telegram bot interactions, including commands and notifications."""
 
     def __init__(self, token: str, db: Database):
-        self.application = Application.builder().token(token).build()
+        # Handlers only touch per-chat state, so independent updates can be processed in parallel
+        builder = (
+            Application.builder().token(token).concurrent_updates(MAX_CONCURRENT_UPDATES)
+            # Pool capped to what can actually be in use at once: a full broadcast plus concurrent handlers (the default is 256)
+            .request(HTTPXRequest(
+                connection_pool_size=MAX_CONCURRENT_SENDS + MAX_CONCURRENT_UPDATES,
+                pool_timeout=5.0, connect_timeout=10.0, read_timeout=20.0, write_timeout=20.0,
+                http_version=HTTP_VERSION
+            ))
+            # Long polls are held open by Telegram for POLLING_TIMEOUT seconds, so allow a little more
+            .get_updates_request(HTTPXRequest(
+                connection_pool_size=1, read_timeout=POLLING_TIMEOUT + 5, http_version=HTTP_VERSION
+            ))
+        )
+        if aiolimiter is not None:
+            # Queues every outgoing API call under Telegram's limits instead of bursting into flood waits
+            builder = builder.rate_limiter(AIORateLimiter(
+                overall_max_rate=RATE_LIMIT_OVERALL_PER_SECOND, overall_time_period=1,
+                group_max_rate=RATE_LIMIT_GROUP_PER_MINUTE, group_time_period=60
+            ))
+        else:
+            logger.warning("[%s] aiolimiter not installed; outgoing messages are not rate limited.", self.__class__.__name__)
+        self.application = builder.build()
         self.db = db
+        self._send_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        # image URL -> Telegram file_id of the photo once uploaded, so later sends skip the re-download
+        self._photo_file_ids: Dict[str, str] = {}
+        # callback action -> (database operation, confirmation template)
+        self._callback_actions = {
+            "subscribe": (self.db.add_subscription, "✅ شما با موفقیت در «{}» مشترک شدید."),
+            "unsubscribe": (self.db.remove_subscription, "🗑️ اشتراک شما در «{}» لغو شد."),
+        }
+        # The store list is static, so the /subscribe keyboard and /unsubscribe buttons are built once and reused
+        self._subscribe_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(display_name, callback_data=f"subscribe_{internal_name}")]
+            for internal_name, display_name in TELEGRAM_STORE_DISPLAY_NAMES.items()
+        ])
+        self._unsubscribe_buttons = {
+            internal_name: InlineKeyboardButton(display_name, callback_data=f"unsubscribe_{internal_name}")
+            for internal_name, display_name in TELEGRAM_STORE_DISPLAY_NAMES.items()
+        }
         self._register_handlers()
-        logger.info(f"[{self.__class__.__name__}] Telegram bot initialized.")
+        logger.info("[%s] Telegram bot initialized.", self.__class__.__name__)
 
     def _register_handlers(self) -> None:
         """Registers all necessary command and callback query handlers."""
@@ -32,38 +115,25 @@ class TelegramBot:
             CallbackQueryHandler(self.button_callback)
         ]
         self.application.add_handlers(handlers)
-        logger.info(f"[{self.__class__.__name__}] Command and callback handlers registered.")
+        logger.info("[%s] Command and callback handlers registered.", self.__class__.__name__)
 
-    def _get_chat_info(self, update: Update) -> Tuple[int, Optional[int]]:
+    @staticmethod
+    def _get_chat_info(update: Update) -> Tuple[int, Optional[int]]:
         """Extracts chat_id and thread_id from a Telegram update."""
-        chat_id = update.effective_chat.id
-        thread_id = update.effective_message.message_thread_id if update.effective_message and update.effective_message.is_topic_message else None
-        return chat_id, thread_id
+        message = update.effective_message
+        return update.effective_chat.id, (message.message_thread_id if message and message.is_topic_message else None)
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handler for the /start command, providing a welcome message."""
         user = update.effective_user
         chat_id, thread_id = self._get_chat_info(update)
-        logger.info(f"[{self.__class__.__name__}] /start from user='{user.full_name}' in chat={chat_id}, thread={thread_id}")
-
-        welcome_message = (
-            f"سلام {user.full_name}! 👋\n\n"
-            "به ربات 'بازی‌های رایگان' خوش آمدید. من هر روز جدیدترین بازی‌های رایگان و تخفیف‌های ویژه را از فروشگاه‌های مختلف پیدا کرده و به شما اطلاع می‌دهم.\n\n"
-            "دستورات موجود:\n"
-            "/subscribe - برای اشتراک در فروشگاه‌های مورد علاقه.\n"
-            "/unsubscribe - برای لغو اشتراک.\n"
-            "/mysubscriptions - برای مشاهده اشتراک‌های فعلی."
-        )
-        await update.message.reply_text(welcome_message)
+        logger.info("[%s] /start from user='%s' in chat=%s, thread=%s", self.__class__.__name__, user.full_name, chat_id, thread_id)
+
+        await update.message.reply_text(WELCOME_TEMPLATE.format(full_name=user.full_name))
 
     async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Displays a keyboard for subscribing to stores."""
-        keyboard = [
-            [InlineKeyboardButton(display_name, callback_data=f"subscribe_{internal_name}")]
-            for internal_name, display_name in TELEGRAM_STORE_DISPLAY_NAMES.items()
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("در کدام فروشگاه‌ها مایلید مشترک شوید؟", reply_markup=reply_markup)
+        await update.message.reply_text("در کدام فروشگاه‌ها مایلید مشترک شوید؟", reply_markup=self._subscribe_markup)
 
     async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Displays a keyboard for unsubscribing from currently subscribed stores."""
@@ -73,10 +143,8 @@ class TelegramBot:
             await update.message.reply_text("شما در حال حاضر در هیچ فروشگاهی مشترک نیستید.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton(TELEGRAM_STORE_DISPLAY_NAMES.get(store, store), callback_data=f"unsubscribe_{store}")]
-            for store in subscriptions
-        ]
+        # Stores outside the known set are skipped; their callbacks would be rejected anyway
+        keyboard = [[self._unsubscribe_buttons[store]] for store in subscriptions if store in self._unsubscribe_buttons]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("کدام اشتراک را لغو می‌کنید؟", reply_markup=reply_markup)
 
@@ -96,88 +164,131 @@ class TelegramBot:
         query = update.callback_query
         await query.answer()
         
-        chat_id, thread_id = self._get_chat_info(query.message)
-        action, store_name = query.data.split('_', 1)
-        display_name = TELEGRAM_STORE_DISPLAY_NAMES.get(store_name, store_name)
-        
-        logger.info(f"[{self.__class__.__name__}] Callback: action='{action}', store='{store_name}' for chat={chat_id}")
+        chat_id, thread_id = self._get_chat_info(update)
+        action, _, store_name = query.data.partition('_')
+        handler = self._callback_actions.get(action)
+        if handler is None or store_name not in VALID_STORES:
+            logger.warning("[%s] Ignoring unknown callback '%s' from chat=%s", self.__class__.__name__, query.data, chat_id)
+            return
 
-        if action == "subscribe":
-            self.db.add_subscription(chat_id, store_name, thread_id)
-            await query.edit_message_text(text=f"✅ شما با موفقیت در «{display_name}» مشترک شدید.")
-        elif action == "unsubscribe":
-            self.db.remove_subscription(chat_id, store_name, thread_id)
-            await query.edit_message_text(text=f"🗑️ اشتراک شما در «{display_name}» لغو شد.")
+        logger.debug("[%s] Callback: action='%s', store='%s' for chat=%s", self.__class__.__name__, action, store_name, chat_id)
+
+        db_operation, confirmation_template = handler
+        db_operation(chat_id, store_name, thread_id)
+        await query.edit_message_text(text=confirmation_template.format(TELEGRAM_STORE_DISPLAY_NAMES[store_name]))
 
     def _format_message_text(self, game: GameData) -> str:
         """Formats the text content for a game notification message."""
-        title = game.get('title', 'عنوان نامشخص')
-        store_key = game.get('store', 'other').lower().replace(' ', '')
-        store_name = TELEGRAM_STORE_DISPLAY_NAMES.get(store_key, game.get('store', 'فروشگاه نامشخص'))
-        
-        header = f"🎮 *بازی رایگان جدید!* 🎮" if game.get('is_free') else f"💰 *تخفیف ویژه!* 💰"
-        
+        is_free = game.get('is_free')
+        store = game.get('store', 'other')
+        store_name = TELEGRAM_STORE_DISPLAY_NAMES.get(store.lower().replace(' ', ''), store)
+
+        # Only dynamic fields are escaped; the static markup is already valid HTML
         lines = [
-            header,
-            f"\nعنوان: *{title}*",
-            f"فروشگاه: *{store_name}*",
+            FREE_GAME_HEADER if is_free else DISCOUNT_HEADER,
+            f"\nعنوان: <b>{escape(game.get('title', 'عنوان نامشخص'))}</b>",
+            f"فروشگاه: <b>{escape(store_name)}</b>",
         ]
-        
-        if not game.get('is_free') and game.get('discount_text'):
-            lines.append(f"تخفیف: *{game['discount_text']}*")
-        
+
+        discount_text = game.get('discount_text')
+        if not is_free and discount_text:
+            lines.append(f"تخفیف: <b>{escape(discount_text)}</b>")
+
         if game.get('is_dlc_or_addon'):
-            lines.append("نوع: *DLC / محتوای اضافی*")
+            lines.append(DLC_LINE)
 
         description = game.get('persian_summary') or game.get('description')
         if description:
-            max_len = 300
-            truncated_desc = description if len(description) <= max_len else description[:max_len] + "..."
-            lines.append(f"\nتوضیحات: {truncated_desc}")
+            truncated_desc = description if len(description) <= MAX_DESCRIPTION_LENGTH else description[:MAX_DESCRIPTION_LENGTH] + "..."
+            lines.append(f"\nتوضیحات: {escape(truncated_desc)}")
 
         # Enriched data section
+        steam_score, metacritic_score, genres = game.get('steam_overall_score'), game.get('metacritic_score'), game.get('persian_genres')
         enriched_lines = []
-        if game.get('steam_overall_score') is not None:
-            enriched_lines.append(f"امتیاز استیم: {game['steam_overall_score']}%")
-        if game.get('metacritic_score') is not None:
-            enriched_lines.append(f"متاکریتیک: {game['metacritic_score']}/100")
-        if game.get('persian_genres'):
-            enriched_lines.append(f"ژانرها: {', '.join(game['persian_genres'])}")
-        
+        if steam_score is not None:
+            enriched_lines.append(f"امتیاز استیم: {steam_score}%")
+        if metacritic_score is not None:
+            enriched_lines.append(f"متاکریتیک: {metacritic_score}/100")
+        if genres:
+            enriched_lines.append(f"ژانرها: {escape(', '.join(genres))}")
         if enriched_lines:
             lines.append("\n" + "\n".join(enriched_lines))
-        
+
         # Links section
-        links = [f"[دریافت بازی]({game.get('url', '#')})"]
-        if game.get('trailer'):
-            links.append(f"[مشاهده تریلر]({game['trailer']})")
-        lines.append("\n" + " | ".join(links))
-            
+        trailer = game.get('trailer')
+        links = f'<a href="{escape(game.get("url", "#"))}">دریافت بازی</a>'
+        if trailer:
+            links += f' | <a href="{escape(trailer)}">مشاهده تریلر</a>'
+        lines.append("\n" + links)
+
         return "\n".join(lines)
 
     async def send_game_notification(self, game: GameData, chat_id: int, thread_id: Optional[int] = None) -> None:
         """Sends a formatted game notification to a specific chat, with robust error handling."""
-        message_text = self._format_message_text(game)
-        image_url = game.get('image_url')
-
-        try:
-            if image_url:
-                await self.application.bot.send_photo(
-                    chat_id=chat_id, photo=image_url, caption=message_text,
-                    parse_mode='Markdown', message_thread_id=thread_id
-                )
-            else:
-                await self.application.bot.send_message(
-                    chat_id=chat_id, text=message_text, parse_mode='Markdown',
-                    disable_web_page_preview=True, message_thread_id=thread_id
-                )
-            logger.info(f"[{self.__class__.__name__}] Notification for '{game['title']}' sent to chat={chat_id}")
-        except TelegramError as e:
-            logger.error(f"[{self.__class__.__name__}] Telegram API error for chat={chat_id}: {e.message}")
-        except Exception as e:
-            logger.error(f"[{self.__class__.__name__}] Unexpected error sending notification to chat={chat_id}: {e}", exc_info=True)
+        await self._send_one(game['title'], self._format_message_text(game), game.get('image_url'), chat_id, thread_id)
+
+    async def broadcast_game(self, game: GameData, targets: List[Tuple[int, Optional[int]]]) -> None:
+        """Sends one game notification to many chats concurrently, formatting the message only once."""
+        title, message_text, image_url = game['title'], self._format_message_text(game), game.get('image_url')
+        if image_url and image_url not in self._photo_file_ids and targets:
+            # Let Telegram download the image once; the remaining chats then reuse the uploaded file_id
+            (chat_id, thread_id), targets = targets[0], targets[1:]
+            await self._send_one(title, message_text, image_url, chat_id, thread_id)
+        await asyncio.gather(*(
+            self._send_one(title, message_text, image_url, chat_id, thread_id) for chat_id, thread_id in targets
+        ))
+
+    async def _send_one(self, title: str, message_text: str, image_url: Optional[str], chat_id: int, thread_id: Optional[int]) -> None:
+        """Sends an already formatted notification, retrying flood waits and transient network errors."""
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            try:
+                async with self._send_semaphore:
+                    if image_url:
+                        message = await self.application.bot.send_photo(
+                            chat_id=chat_id, photo=self._photo_file_ids.get(image_url, image_url), caption=message_text,
+                            parse_mode=ParseMode.HTML, message_thread_id=thread_id
+                        )
+                        if message.photo:
+                            self._photo_file_ids[image_url] = message.photo[-1].file_id
+                    else:
+                        await self.application.bot.send_message(
+                            chat_id=chat_id, text=message_text, parse_mode=ParseMode.HTML,
+                            disable_web_page_preview=True, message_thread_id=thread_id
+                        )
+                logger.info("[%s] Notification for '%s' sent to chat=%s", self.__class__.__name__, title, chat_id)
+                return
+            except RetryAfter as e:
+                # retry_after is seconds as int, or a timedelta in newer python-telegram-bot releases
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                logger.warning("[%s] Flood limit for chat=%s, retrying in %ss", self.__class__.__name__, chat_id, delay)
+            except BadRequest as e:
+                # Subclass of NetworkError, but retrying an invalid request cannot succeed
+                logger.error("[%s] Telegram API error for chat=%s: %s", self.__class__.__name__, chat_id, e.message)
+                return
+            except NetworkError as e:
+                delay = 2 ** attempt
+                logger.warning("[%s] Network error for chat=%s (%s), retrying in %ss", self.__class__.__name__, chat_id, e.message, delay)
+            except TelegramError as e:
+                logger.error("[%s] Telegram API error for chat=%s: %s", self.__class__.__name__, chat_id, e.message)
+                return
+            except Exception as e:
+                logger.error("[%s] Unexpected error sending notification to chat=%s: %s", self.__class__.__name__, chat_id, e, exc_info=True)
+                return
+            # Sleep outside the semaphore so other chats keep sending meanwhile
+            if attempt < MAX_SEND_ATTEMPTS - 1:
+                await asyncio.sleep(delay)
+        logger.error("[%s] Giving up on notification for '%s' to chat=%s after %s attempts", self.__class__.__name__, title, chat_id, MAX_SEND_ATTEMPTS)
 
     def run_polling(self) -> None:
         """Runs the bot in polling mode for local development."""
-        logger.info(f"[{self.__class__.__name__}] Starting bot in polling mode...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
\ No newline at end of file
+        logger.info("[%s] Starting bot in polling mode...", self.__class__.__name__)
+        self.application.run_polling(allowed_updates=Update.ALL_TYPES, timeout=POLLING_TIMEOUT)
+
+    def run_webhook(self, listen: str, port: int, url_path: str, webhook_url: str, secret_token: Optional[str] = None) -> None:
+        """Runs the bot in webhook mode, letting Telegram push updates instead of being polled."""
+        logger.info("[%s] Starting bot in webhook mode on %s:%s/%s...", self.__class__.__name__, listen, port, url_path)
+        self.application.run_webhook(
+            listen=listen, port=port, url_path=url_path, webhook_url=webhook_url,
+            secret_token=secret_token, allowed_updates=Update.ALL_TYPES
+        )
\ No newline at end of file
@@ -1,12 +1,13 @@
 # ===== IMPORTS & DEPENDENCIES =====
+import asyncio
 import logging
 import aiohttp
 import os
-from typing import Optional, Dict
-from urllib.parse import urlencode
-from bs4 import BeautifulSoup
-
-from src.core.base_client import BaseWebClient
+import re
+from typing import Awaitable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+from src.core.base_client import BaseWebClient, json_loads
+from src.utils.html_utils import parse_html, css_first_attrs
 from src.models.game import GameData
 from src.config import DEFAULT_CACHE_TTL, CACHE_DIR
 
@@ -18,8 +19,20 @@ SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 SERPAPI_URL = "https://serpapi.com/search.json"
 ITUNES_SEARCH_URL = "https://itunes.apple.com/search"
 
+# Meta tags checked for a cover image, highest quality first
+META_IMAGE_SELECTORS = (
+    "meta[property='og:image']",
+    "meta[name='twitter:image']",
+    "link[rel='apple-touch-icon']"  # Good fallback for mobile apps
+)
+
 # Domains to blacklist for images (e.g., low-quality placeholders, trackers)
 IMAGE_DOMAIN_BLACKLIST = ["gravatar.com", "avatar.com"]
+# Hostnames are matched against this set (including parent domains), so a check costs one lookup per label.
+_BLACKLISTED_DOMAINS = frozenset(IMAGE_DOMAIN_BLACKLIST)
+_VALID_URL_SCHEMES = frozenset(("http", "https"))
+# The image meta/link tags live in <head>, so everything after it can be dropped before parsing
+_HEAD_END_PATTERN = re.compile(r'</head\s*>', re.IGNORECASE)
 
 # ===== CORE BUSINESS LOGIC =====
 class ImageEnricher(BaseWebClient):
@@ -37,10 +50,19 @@ class ImageEnricher(BaseWebClient):
 
     def _is_valid_image_url(self, url: Optional[str]) -> bool:
         """A simple validator to check if the URL is a plausible image."""
-        if not url or not url.startswith('http'):
+        if not url:
+            return False
+        try:
+            parts = urlsplit(url)
+            host = parts.hostname or ''
+        except ValueError:
+            return False
+        if parts.scheme not in _VALID_URL_SCHEMES or not host:
             return False
-        if any(blacklisted_domain in url for blacklisted_domain in IMAGE_DOMAIN_BLACKLIST):
-            logger.debug(f"[ImageEnricher] URL '{url}' is blacklisted.")
+        # Check the host itself and every parent domain, e.g. 'a.b.gravatar.com' -> 'b.gravatar.com' -> 'gravatar.com'
+        labels = host.split('.')
+        if any('.'.join(labels[i:]) in _BLACKLISTED_DOMAINS for i in range(len(labels))):
+            logger.debug("[ImageEnricher] URL '%s' is blacklisted.", url)
             return False
         return True
 
@@ -72,16 +94,20 @@ class ImageEnricher(BaseWebClient):
         try:
             async with self._session.get(SERPAPI_URL, params=params, timeout=20) as response:
                 response.raise_for_status()
-                results = await response.json()
+                results = json_loads(await response.read())
                 
                 if "images_results" in results and results["images_results"]:
+                    # One pass: stop at the first valid landscape image, remembering the first valid one as a fallback
+                    first_valid = None
                     for img in results["images_results"]:
                         img_url = img.get("original")
-                        if self._is_valid_image_url(img_url) and img.get("original_width", 0) > img.get("original_height", 0):
+                        if not self._is_valid_image_url(img_url):
+                            continue
+                        if img.get("original_width", 0) > img.get("original_height", 0):
                             logger.info(f"✅ [ImageEnricher] Found high-quality image for '{query}' via SerpApi.")
                             return img_url
-                    # Fallback to the first valid image
-                    first_valid = next((res["original"] for res in results["images_results"] if self._is_valid_image_url(res.get("original"))), None)
+                        if first_valid is None:
+                            first_valid = img_url
                     if first_valid:
                          logger.info(f"✅ [ImageEnricher] Found fallback image for '{query}' via SerpApi.")
                     return first_valid
@@ -96,23 +122,37 @@ class ImageEnricher(BaseWebClient):
         if not html_content:
             return None
         
-        soup = BeautifulSoup(html_content, 'lxml')
-        
-        # Prioritize high-quality meta tags
-        selectors = [
-            "meta[property='og:image']",
-            "meta[name='twitter:image']",
-            "link[rel='apple-touch-icon']" # Good fallback for mobile apps
-        ]
-        for selector in selectors:
-            tag = soup.select_one(selector)
-            if tag and tag.get("content"):
-                image_url = tag["content"]
-                if self._is_valid_image_url(image_url):
-                    logger.info(f"✅ [ImageEnricher] Found '{selector}' meta tag image in {url}")
-                    return image_url
+        head_end = _HEAD_END_PATTERN.search(html_content)
+        if head_end:
+            html_content = html_content[:head_end.end()]
+
+        document = parse_html(html_content)
+        # Prioritize high-quality meta tags; <link> tags carry the URL in href instead of content
+        for selector in META_IMAGE_SELECTORS:
+            attributes = css_first_attrs(document, selector)
+            image_url = attributes and (attributes.get("content") or attributes.get("href"))
+            if self._is_valid_image_url(image_url):
+                logger.info(f"✅ [ImageEnricher] Found '{selector}' meta tag image in {url}")
+                return image_url
         return None
 
+    async def _first_valid_image(self, lookups: List[Awaitable[Optional[str]]]) -> Optional[str]:
+        """Runs independent image lookups concurrently and returns the first valid URL, cancelling the rest."""
+        pending = {asyncio.ensure_future(lookup) for lookup in lookups}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning("⚠️ [ImageEnricher] Image lookup failed: %s", task.exception())
+                        continue
+                    if self._is_valid_image_url(task.result()):
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
     async def enrich(self, game: GameData, cleaned_title: str) -> GameData:
         """
         Public method to find the best image for a game if one is missing,
@@ -126,16 +166,17 @@ class ImageEnricher(BaseWebClient):
         logger.info(f"🖼️ [ImageEnricher] No valid image for '{cleaned_title}'. Starting image search cascade...")
         image_url = None
 
-        # --- Stage 2: Free, store-specific API lookups ---
+        # --- Stages 2 & 3: Free lookups, run concurrently; the first valid image wins ---
+        free_lookups = []
         store = game.get('store', '')
         if store in ['iosappstore', 'ios']:
-            image_url = await self._get_from_itunes_api(cleaned_title, "software")
+            free_lookups.append(self._get_from_itunes_api(cleaned_title, "software"))
         # Note: Google Play does not have a simple, reliable public API like iTunes.
-
-        # --- Stage 3: Scrape meta tags from the deal URL (Free) ---
-        if not image_url and game.get('url'):
+        if game.get('url'):
             logger.debug("[ImageEnricher] Trying to scrape meta tags from deal URL.")
-            image_url = await self._scrape_from_meta_tags(game['url'])
+            free_lookups.append(self._scrape_from_meta_tags(game['url']))
+        if free_lookups:
+            image_url = await self._first_valid_image(free_lookups)
 
         # --- Stage 4: Paid API search (Last Resort) ---
         if not image_url:
@@ -2,50 +2,67 @@
 import logging
 import aiohttp
 import re
+from collections import OrderedDict
 from typing import Optional
-from bs4 import BeautifulSoup
-
 from src.core.base_client import BaseWebClient
 from src.models.game import GameData
 from src.config import METACRITIC_BASE_URL, METACRITIC_SEARCH_URL, DEFAULT_CACHE_TTL, CACHE_DIR
 from src.utils.game_utils import clean_title
+from src.utils.html_utils import parse_html, css_first_attrs, css_first_text
 import os
 
 # ===== CONFIGURATION & CONSTANTS =====
 logger = logging.getLogger(__name__)
+_WHITESPACE_RE = re.compile(r'\s+')
+_USER_SCORE_RE = re.compile(r"^\d+(\.\d+)?$")
 
 # ===== CORE BUSINESS LOGIC =====
 class MetacriticEnricher(BaseWebClient):
     """Enriches game data with critic and user scores from Metacritic."""
 
+    PAGE_URL_CACHE_SIZE = 2048
+
     def __init__(self, session: aiohttp.ClientSession, cache_ttl: int = DEFAULT_CACHE_TTL):
         super().__init__(
             cache_dir=os.path.join(CACHE_DIR, "metacritic"),
             cache_ttl=cache_ttl,
             session=session
         )
+        # Normalized search query -> game page URL (or None if the search had no game result).
+        # Editions and DLCs often clean to the same title, so this skips re-parsing the same search page.
+        self._page_url_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
 
     async def _find_game_page_url(self, game_title: str) -> Optional[str]:
         """Searches Metacritic and returns the URL of the first game result."""
         cleaned_title = clean_title(game_title)
-        search_query = re.sub(r'\s+', ' ', cleaned_title).strip()
+        search_query = _WHITESPACE_RE.sub(' ', cleaned_title).strip()
         if not search_query:
             return None
+        if search_query in self._page_url_cache:
+            self._page_url_cache.move_to_end(search_query)
+            return self._page_url_cache[search_query]
         
         search_url = METACRITIC_SEARCH_URL.format(query=search_query)
         logger.info(f"[{self.__class__.__name__}] Searching Metacritic for '{search_query}'")
         
         html_content = await self._fetch(search_url, is_json=False)
         if not html_content:
-            return None
+            return None  # Not cached, so a transient fetch failure is retried next time
+
+        page_url = self._parse_search_results(html_content, search_query)
+        self._page_url_cache[search_query] = page_url
+        if len(self._page_url_cache) > self.PAGE_URL_CACHE_SIZE:
+            self._page_url_cache.popitem(last=False)
+        return page_url
 
-        soup = BeautifulSoup(html_content, 'lxml')
-        results_container = soup.find('div', id='main-content')
-        if not results_container:
+    def _parse_search_results(self, html_content: str, search_query: str) -> Optional[str]:
+        """Returns the URL of the first game result on a Metacritic search page."""
+        document = parse_html(html_content)
+        if css_first_attrs(document, 'div#main-content') is None:
             logger.warning(f"[{self.__class__.__name__}] Could not find main content container on Metacritic for '{search_query}'.")
             return None
             
-        first_result_link = results_container.select_one('a[href^="/game/"]')
+        first_result_link = css_first_attrs(document, 'div#main-content a[href^="/game/"]')
         if first_result_link:
             game_page_path = first_result_link['href']
             full_url = METACRITIC_BASE_URL + game_page_path
@@ -57,13 +74,13 @@ class MetacriticEnricher(BaseWebClient):
 
     def _parse_scores_from_page(self, html_content: str, title: str) -> GameData:
         """Parses the critic and user scores from a Metacritic game page."""
-        soup = BeautifulSoup(html_content, 'lxml')
+        document = parse_html(html_content)
         scores: GameData = {}
         
         # Critic Score
-        critic_score_tag = soup.select_one('[data-testid="metascore-value"]')
-        if critic_score_tag:
-            score_text = critic_score_tag.text.strip()
+        critic_score_text = css_first_text(document, '[data-testid="metascore-value"]')
+        if critic_score_text is not None:
+            score_text = critic_score_text.strip()
             if score_text.isdigit():
                 scores['metacritic_score'] = int(score_text)
                 logger.debug(f"[Metacritic Parser] Found critic score for '{title}': {score_text}")
@@ -73,10 +90,10 @@ class MetacriticEnricher(BaseWebClient):
             logger.debug(f"[Metacritic Parser] Critic score tag '[data-testid=\"metascore-value\"]' not found for '{title}'.")
         
         # User Score
-        user_score_tag = soup.select_one('div[data-testid="userscore-value"] > span')
-        if user_score_tag:
-            score_text = user_score_tag.text.strip()
-            if re.match(r"^\d+(\.\d+)?$", score_text):
+        user_score_text = css_first_text(document, 'div[data-testid="userscore-value"] > span')
+        if user_score_text is not None:
+            score_text = user_score_text.strip()
+            if _USER_SCORE_RE.match(score_text):
                 scores['metacritic_userscore'] = float(score_text)
                 logger.debug(f"[Metacritic Parser] Found user score for '{title}': {score_text}")
             else:
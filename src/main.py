@@ -1,19 +1,24 @@
 # ===== IMPORTS & DEPENDENCIES =====
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import os
 import json
 import aiohttp
 import re
+import time
 from typing import List, Dict, Any, Optional
 
 # --- Configuration ---
 from src.config import (
-    LOG_LEVEL, WEB_DATA_DIR, WEB_DATA_FILE,
+    LOG_LEVEL, WEB_DATA_DIR, WEB_DATA_FILE, COMMON_HEADERS,
     DLC_KEYWORDS, AMBIGUOUS_KEYWORDS, POSITIVE_GAME_KEYWORDS
 )
 
 # --- Core Components ---
+from src.core.base_client import BaseWebClient
 from src.core.database import Database
 from src.core.telegram_bot import TelegramBot
 
@@ -36,11 +41,21 @@ from src.translation.translator import SmartTranslator
 from src.utils.game_utils import infer_store_from_game_data, normalize_url_for_key, clean_title, sanitize_html
 
 # ===== CONFIGURATION & CONSTANTS =====
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Leave logging alone if the embedding process (or a re-import) has already configured it
+if not logging.getLogger().handlers:
+    # Records are handed to a background thread through a queue, so the event loop never blocks on stderr writes
+    # (QueueHandler formats each record before enqueueing it, so the listener's handler prints it as-is)
+    _log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[logging.handlers.QueueHandler(_log_queue)]
+    )
+    _log_listener.start()
+    # Stopping drains the queue, so records logged right before exit are still written
+    atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -171,28 +186,32 @@ class GamePipeline:
 
     def _filter_games_for_notification(self, games: List[GameData]) -> List[GameData]:
         logger.info("--- Step 3: Filtering games for Telegram notification ---")
-        games_to_notify = []
-        for game in games:
-            if not game.get('is_free') or game.get('is_dlc_or_addon'):
-                continue
-            dedup_key = self._get_canonical_id(game)
-            if not self.db.is_game_posted_in_last_days(dedup_key, days=30):
-                games_to_notify.append(game)
-        return games_to_notify
+        candidates = [
+            (game, self._get_canonical_id(game)) for game in games
+            if game.get('is_free') and not game.get('is_dlc_or_addon')
+        ]
+        # One cutoff and one bulk probe for the whole cycle instead of a query per game
+        cutoff = int(time.time()) - 30 * 86400
+        unposted = self.db.filter_unposted((dedup_key for _, dedup_key in candidates), cutoff)
+        return [game for game, dedup_key in candidates if dedup_key in unposted]
 
     async def _send_notifications(self, games_to_notify: List[GameData]) -> None:
         if not self.bot:
             logger.warning("Telegram bot object not initialized. Skipping notifications.")
             return
         logger.info(f"--- Step 4: Sending {len(games_to_notify)} notifications ---")
-        for game in games_to_notify:
-            targets = self.db.get_targets_for_store(game['store'])
-            if not targets:
-                logger.warning(f"No subscribers for store '{game['store']}'. Skipping '{game['title']}'.")
-                continue
-            notification_tasks = [self.bot.send_game_notification(game, chat_id, thread_id) for chat_id, thread_id in targets]
-            await asyncio.gather(*notification_tasks, return_exceptions=True)
-            self.db.add_posted_game(self._get_canonical_id(game))
+        posted_keys: List[str] = []
+        try:
+            for game in games_to_notify:
+                targets = self.db.get_targets_for_store(game['store'])
+                if not targets:
+                    logger.warning(f"No subscribers for store '{game['store']}'. Skipping '{game['title']}'.")
+                    continue
+                await self.bot.broadcast_game(game, targets)
+                posted_keys.append(self._get_canonical_id(game))
+        finally:
+            # Record what was already sent even if the loop is interrupted, so those games are not re-sent next run
+            self.db.add_posted_games(posted_keys)
 
     def _save_for_web(self, all_games: List[GameData]) -> None:
         logger.info("--- Step 5: Saving data for web front-end ---")
@@ -214,6 +233,11 @@ class GamePipeline:
         except Exception as e:
             logger.error(f"❌ Failed to save web data to {output_path}: {e}", exc_info=True)
 
+    async def close(self) -> None:
+        """Lets every web client finish its background work before the shared session is closed."""
+        clients = [*self.sources, self.steam_enricher, self.metacritic_enricher, self.image_enricher, self.translator]
+        await asyncio.gather(*(client.close() for client in clients if isinstance(client, BaseWebClient)))
+
     async def run(self) -> None:
         logger.info("🚀🚀🚀 Starting Game Deals Pipeline 🚀🚀🚀")
         raw_games = await self._fetch_raw_games()
@@ -231,12 +255,23 @@ class GamePipeline:
 async def main():
     db = Database()
     bot = TelegramBot(token=TELEGRAM_BOT_TOKEN, db=db) if TELEGRAM_BOT_TOKEN else None
-    async with aiohttp.ClientSession() as session:
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=300, enable_cleanup_closed=True)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        headers=COMMON_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=25)
+    ) as session:
         pipeline = GamePipeline(db, bot, session)
         try:
             await pipeline.run()
         except Exception as e:
             logger.critical(f"🔥🔥🔥 A critical error occurred in the main pipeline: {e}", exc_info=True)
+        finally:
+            try:
+                await pipeline.close()
+            finally:
+                # Closing checkpoints the WAL back into games.db, which the workflow commits.
+                db.close()
 
 if __name__ == "__main__":
     if os.name == 'nt':
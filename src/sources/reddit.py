@@ -12,7 +12,7 @@ import os
 
 from src.core.base_client import BaseWebClient
 from src.models.game import GameData
-from src.config import REDDIT_SUBREDDITS, REDDIT_RSS_URL_TEMPLATE, DEFAULT_CACHE_TTL, CACHE_DIR, COMMON_HEADERS
+from src.config import REDDIT_SUBREDDITS, REDDIT_RSS_URL_TEMPLATE, DEFAULT_CACHE_TTL, CACHE_DIR
 from src.utils.game_utils import clean_title, infer_store_from_game_data
 
 # ===== CONFIGURATION & CONSTANTS =====
@@ -159,7 +159,7 @@ class RedditSource(BaseWebClient):
         all_games: List[GameData] = []
         
         for subreddit_name, url in self.rss_urls.items():
-            rss_content = await self._fetch(url, is_json=False, headers=COMMON_HEADERS)
+            rss_content = await self._fetch(url, is_json=False)
             if not rss_content: continue
             
             try:
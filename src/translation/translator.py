@@ -1,5 +1,6 @@
 # ===== IMPORTS & DEPENDENCIES =====
 import logging
+import asyncio
 import aiohttp
 from typing import Optional
 from urllib.parse import urlencode
@@ -87,10 +88,12 @@ class SmartTranslator(BaseWebClient):
 
         # Check cache using the cleaned text as the key
         cache_path = self._get_cache_path(clean_text_to_translate, extension="txt")
-        if self._is_cache_valid(cache_path):
-             with open(cache_path, 'r', encoding='utf-8') as f:
-                logger.info(f"✅ [{self.__class__.__name__}] Loading translation from cache for: '{clean_text_to_translate[:30]}...'")
-                return f.read()
+        if await asyncio.to_thread(self._is_cache_valid, cache_path):
+            logger.info(f"✅ [{self.__class__.__name__}] Loading translation from cache for: '{clean_text_to_translate[:30]}...'")
+            # A corrupt cache file is deleted and None returned, so we fall through and translate again
+            cached_translation = await self._load_cache_file(cache_path, is_json=False)
+            if cached_translation is not None:
+                return cached_translation
 
         logger.info(f"➡️ [{self.__class__.__name__}] Translating text: '{clean_text_to_translate[:50]}...'")
         
@@ -111,7 +114,6 @@ class SmartTranslator(BaseWebClient):
                 return clean_text_to_translate # Fallback to the cleaned original text
 
         # Save successful translation to cache
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            f.write(translated_text)
+        await self._write_cache(cache_path, translated_text)
 
         return translated_text
\ No newline at end of file
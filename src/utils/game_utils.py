@@ -1,7 +1,7 @@
 # ===== IMPORTS & DEPENDENCIES =====
 import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from urllib.parse import urlparse, parse_qs, urlencode
 from bs4 import BeautifulSoup
 from fuzzywuzzy import process
@@ -12,8 +12,44 @@ from src.models.game import GameData
 # ===== CONFIGURATION & CONSTANTS =====
 logger = logging.getLogger(__name__)
 
+# Domain keywords from STORE_KEYWORD_MAP, looked up by hostname suffix in O(1) per label.
+_DOMAIN_TO_STORE = {k: v for k, v in STORE_KEYWORD_MAP.items() if '.' in k}
+# Every domain keyword folded into one pattern, so the URL is scanned once instead of once per domain.
+_STORE_DOMAIN_PATTERN = re.compile('|'.join(re.escape(k) for k in _DOMAIN_TO_STORE))
+
+# Title keyword patterns, compiled once. Each maps keyword -> priority so a single scan can
+# still honour the original order: dict order for tags, longest keyword first for whole words.
+_TAG_KEYWORD_PRIORITY = {k: i for i, k in enumerate(STORE_KEYWORD_MAP)}
+_TITLE_TAG_PATTERN = re.compile(
+    r'[\[\(]\s*(' + '|'.join(re.escape(k) for k in sorted(STORE_KEYWORD_MAP, key=len, reverse=True)) + r')\s*[\]\)]'
+)
+_WORD_KEYWORD_PRIORITY = {
+    k: i for i, k in enumerate(sorted((k for k in STORE_KEYWORD_MAP if '.' not in k), key=len, reverse=True))
+}
+_TITLE_WORD_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(k) for k in _WORD_KEYWORD_PRIORITY) + r')\b')
+
 # ===== UTILITY FUNCTIONS =====
 
+def _find_best_keyword(pattern: re.Pattern, text: str, priority: Dict[str, int]) -> Optional[str]:
+    """Scans text once and returns the matched keyword with the best (lowest) priority."""
+    return min((m.group(1) for m in pattern.finditer(text)), key=priority.__getitem__, default=None)
+
+def classify_store_from_url(url: str) -> Optional[str]:
+    """Returns the canonical store for a lowercase URL, checking its hostname before scanning the whole URL."""
+    try:
+        hostname = urlparse(url).hostname or ''
+    except ValueError:  # Malformed netloc, e.g. an unbalanced IPv6 bracket
+        hostname = ''
+    labels = hostname.split('.')
+    # Walk the hostname suffixes, e.g. store.steampowered.com -> steampowered.com
+    for i in range(len(labels) - 1):
+        store_name = _DOMAIN_TO_STORE.get('.'.join(labels[i:]))
+        if store_name:
+            return store_name
+    # Fall back to a store domain appearing elsewhere in the URL (e.g. inside a redirect link)
+    match = _STORE_DOMAIN_PATTERN.search(url)
+    return _DOMAIN_TO_STORE[match.group(0)] if match else None
+
 def clean_title(raw_title: str) -> str:
     """
     Intelligently cleans a game title for searching and display by removing noise in multiple stages.
@@ -70,26 +106,23 @@ def infer_store_from_game_data(game: GameData) -> str:
     logger.debug(f"[infer_store] Inferring for URL='{url}', Title='{raw_title[:70]}...'")
 
     # Priority 1: Check URL for domain mapping (most reliable)
-    for domain, store_name in STORE_KEYWORD_MAP.items():
-        if '.' in domain and domain in url:
-            logger.debug(f"[infer_store] Priority 1 Match: Found '{store_name}' from domain '{domain}' in URL.")
-            return store_name
+    store_name = classify_store_from_url(url)
+    if store_name:
+        logger.debug(f"[infer_store] Priority 1 Match: Found '{store_name}' from domain in URL.")
+        return store_name
             
     # Priority 2: Check for explicit tags in the raw title (e.g., [Steam], (GOG))
-    for keyword, store_name in STORE_KEYWORD_MAP.items():
-        pattern = r'[\[\(]\s*' + re.escape(keyword) + r'\s*[\]\)]'
-        if re.search(pattern, raw_title, re.IGNORECASE):
-            logger.debug(f"[infer_store] Priority 2 Match: Found '{store_name}' from tag matching pattern '{pattern}' in title.")
-            return store_name
+    keyword = _find_best_keyword(_TITLE_TAG_PATTERN, raw_title, _TAG_KEYWORD_PRIORITY)
+    if keyword:
+        logger.debug(f"[infer_store] Priority 2 Match: Found '{STORE_KEYWORD_MAP[keyword]}' from tag '{keyword}' in title.")
+        return STORE_KEYWORD_MAP[keyword]
             
     # Priority 3: Check for keywords as whole words in the title
-    # Sort keywords by length to match longer phrases first (e.g., "epic games" before "epic")
-    sorted_keywords = sorted([k for k in STORE_KEYWORD_MAP.keys() if '.' not in k], key=len, reverse=True)
-    for keyword in sorted_keywords:
-        pattern = r'\b' + re.escape(keyword) + r'\b'
-        if re.search(pattern, raw_title, re.IGNORECASE):
-             logger.debug(f"[infer_store] Priority 3 Match: Found '{STORE_KEYWORD_MAP[keyword]}' from keyword matching pattern '{pattern}' in title.")
-             return STORE_KEYWORD_MAP[keyword]
+    # Longer phrases take precedence over shorter ones (e.g., "epic games" before "epic")
+    keyword = _find_best_keyword(_TITLE_WORD_PATTERN, raw_title, _WORD_KEYWORD_PRIORITY)
+    if keyword:
+        logger.debug(f"[infer_store] Priority 3 Match: Found '{STORE_KEYWORD_MAP[keyword]}' from keyword '{keyword}' in title.")
+        return STORE_KEYWORD_MAP[keyword]
 
     # Priority 4: Subreddit Hints (for mobile stores)
     subreddit = game.get('subreddit', '').lower()
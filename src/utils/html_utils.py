@@ -0,0 +1,35 @@
+# ===== IMPORTS & DEPENDENCIES =====
+from typing import Any, Dict, Optional
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser  # C-based parser, much faster than bs4 + lxml
+except ImportError:
+    HTMLParser = None
+
+# ===== CORE BUSINESS LOGIC =====
+def parse_html(html_content: str) -> Any:
+    """Parses a document with selectolax when it is installed, otherwise with BeautifulSoup + lxml."""
+    if HTMLParser is not None:
+        return HTMLParser(html_content)
+    return BeautifulSoup(html_content, 'lxml')
+
+def _css_first(document: Any, selector: str) -> Any:
+    """Returns the first node matching a CSS selector in a document from `parse_html`, or None."""
+    if HTMLParser is not None:
+        return document.css_first(selector)
+    return document.select_one(selector)
+
+def css_first_text(document: Any, selector: str) -> Optional[str]:
+    """Returns the text of the first node matching `selector`, or None if nothing matches."""
+    node = _css_first(document, selector)
+    if node is None:
+        return None
+    return node.text() if HTMLParser is not None else node.text
+
+def css_first_attrs(document: Any, selector: str) -> Optional[Dict[str, Any]]:
+    """Returns the attributes of the first node matching `selector`, or None if nothing matches."""
+    node = _css_first(document, selector)
+    if node is None:
+        return None
+    return node.attributes if HTMLParser is not None else node.attrs